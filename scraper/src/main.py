@@ -1,6 +1,8 @@
 import asyncio
 import logging
 import os
+from dataclasses import dataclass
+from typing import Optional
 from dotenv import load_dotenv
 
 from src.parsers.telegram_parser import TelegramNewsParser
@@ -14,55 +16,108 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
-def load_config() -> dict:
+def parse_acks(value: str) -> int | str:
+    """Parse KAFKA_ACKS value (0, 1 or all, -1 is a synonym of all)"""
+    normalized = value.strip().lower()
+    if normalized in ("all", "-1"):
+        return "all"
+    if normalized in ("0", "1"):
+        return int(normalized)
+    raise ValueError(f"Invalid KAFKA_ACKS: '{value}', expected 0, 1 or all")
+
+
+def parse_int(name: str, default: str) -> int:
+    """Parse integer environment variable"""
+    value = os.getenv(name, default)
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f"Invalid {name}: '{value}' is not a valid integer") from None
+
+
+@dataclass(frozen=True, slots=True)
+class Config:
+    """Scraper config"""
+
+    # Telegram
+    telegram_api_id: Optional[str]
+    telegram_api_hash: Optional[str]
+
+    # Kafka
+    kafka_brokers: Optional[str]
+    kafka_topic: str
+    kafka_linger_ms: int
+    kafka_acks: int | str
+
+    # Channels for monitoring
+    channels: tuple[str, ...]
+
+
+def load_config() -> Config:
     """Load config from .env"""
     load_dotenv()
 
-    return {
-        # Telegram
-        "telegram_api_id": os.getenv("TELEGRAM_API_ID"),
-        "telegram_api_hash": os.getenv("TELEGRAM_API_HASH"),
+    return Config(
+        telegram_api_id=os.getenv("TELEGRAM_API_ID"),
+        telegram_api_hash=os.getenv("TELEGRAM_API_HASH"),
 
-        # Kafka
-        "kafka_brokers": os.getenv("KAFKA_BROKERS"),
-        "kafka_topic": os.getenv("KAFKA_TOPIC", "news_raw"),
+        kafka_brokers=os.getenv("KAFKA_BROKERS"),
+        kafka_topic=os.getenv("KAFKA_TOPIC", "news_raw"),
+        kafka_linger_ms=parse_int("KAFKA_LINGER_MS", "100"),
+        # Leader ack by default: lower latency, but a retried send may be indexed twice,
+        # set KAFKA_ACKS=all for idempotent delivery
+        kafka_acks=parse_acks(os.getenv("KAFKA_ACKS", "1")),
+
+        # Channels separated by comma
+        channels=tuple(c.strip() for c in os.getenv("TELEGRAM_CHANNELS", "").split(',') if c.strip()),
+    )
 
-        # Channels for monitoring separated by comma
-        "channels": [c.strip() for c in os.getenv("TELEGRAM_CHANNELS", "").split(',') if c.strip()],
-    }
+
+def handle_loop_exception(loop: asyncio.AbstractEventLoop, context: dict):
+    """Log errors of async tasks, which were not handled"""
+    logger.error(f"Unhandled async error: {context['message']}", exc_info=context.get('exception'))
 
 
 async def main():
     """Main function"""
-    config = load_config()
+    asyncio.get_running_loop().set_exception_handler(handle_loop_exception)
+    try:
+        config = load_config()
+    except ValueError as e:
+        logger.error(e)
+        return
 
     # Check required variables
-    if not config["telegram_api_id"] or not config["telegram_api_hash"] or not config["kafka_brokers"]:
+    if not config.telegram_api_id or not config.telegram_api_hash or not config.kafka_brokers:
         logger.error("TELEGRAM_API_ID, TELEGRAM_API_HASH and KAFKA_BROKERS must be set in .env")
         return
 
     # Initialize producer
-    logger.info(f"Initializing Kafka producer for {config['kafka_brokers']}")
+    logger.info(f"Initializing Kafka producer for {config.kafka_brokers}")
     producer = KafkaNewsProducer(
-        bootstrap_servers=config["kafka_brokers"],
-        topic=config["kafka_topic"]
+        bootstrap_servers=config.kafka_brokers,
+        topic=config.kafka_topic,
+        linger_ms=config.kafka_linger_ms,
+        acks=config.kafka_acks
     )
 
     # Initialize parser
     parser = TelegramNewsParser(
-        api_id=config["telegram_api_id"],
-        api_hash=config["telegram_api_hash"],
+        api_id=config.telegram_api_id,
+        api_hash=config.telegram_api_hash,
         producer=producer,
-        monitored_channels=config["channels"]
+        monitored_channels=config.channels
     )
 
-    # Start parser
-    logger.info(f"Starting parser with {len(config['channels'])} channels")
+    # Start producer and parser
+    logger.info(f"Starting parser with {len(config.channels)} channels")
     try:
+        await producer.start()
         await parser.start()
     except Exception as e:
         logger.error(f"Failed to start parser: {e}")
     finally:
+        await producer.stop()
         logger.info("Parser stopped")
 
 
@@ -0,0 +1,16 @@
+from dataclasses import dataclass
+from typing import Optional
+
+
+@dataclass(frozen=True, slots=True)
+class NewsRecord:
+    """Kafka message with parsed news, serialized by orjson without intermediate dict"""
+
+    id: str
+    source: str
+    channel_id: int
+    channel_name: Optional[str]
+    channel_title: Optional[str]
+    message_id: int
+    text: str
+    date: Optional[str]
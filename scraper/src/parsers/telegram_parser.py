@@ -1,16 +1,26 @@
+import asyncio
 import logging
-import uuid
-from typing import Dict, Any, Optional
+from typing import Optional, Sequence
 from telethon import TelegramClient, events
-from telethon.tl.types import Message
+from telethon.hints import Entity
+from telethon.tl.types import Message, MessageEntityTextUrl
+
+from src.models.news import NewsRecord
 
 logger = logging.getLogger(__name__)
 
+# Max number of parsed news waiting for producer
+QUEUE_MAX_SIZE = 10_000
+
+# Limits of one batch drained from queue to producer
+DRAIN_BATCH_SIZE = 1000
+DRAIN_INTERVAL_SEC = 0.05
+
 
 class TelegramNewsParser:
     """Scraper for hot tours from Telegram"""
 
-    def __init__(self, api_id: str, api_hash: str, producer, monitored_channels: list[str] | None = None):
+    def __init__(self, api_id: str, api_hash: str, producer, monitored_channels: Sequence[str] | None = None):
         """
         Args:
             api_id: Telegram API ID
@@ -24,71 +34,129 @@ class TelegramNewsParser:
             raise ValueError(f"Invalid TELEGRAM_API_ID: '{api_id}' is not a valid integer") from None
         self.api_hash = api_hash
         self.producer = producer
+        self._send = producer.send_news_async
         self.monitored_channels = monitored_channels or []
-        self.monitored_channel_ids = set()
+        self.monitored_channels_by_id: dict[int, Entity] = {}
+        self._key_cache: dict[int, bytes] = {}
         self.client = TelegramClient('news_parser_session', self.api_id, self.api_hash)
-        self._setup_handlers()
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=QUEUE_MAX_SIZE)
+        self._drain_task: asyncio.Task | None = None
+        self._disconnect_task: asyncio.Task | None = None
 
     def _setup_handlers(self):
-        """Setting up handlers"""
-
-        @self.client.on(events.NewMessage)
-        async def message_handler(event):
-            """Process new messages"""
-            try:
-                if await self._should_process_message(event.message):
-                    news_data = await self._parse_message(event.message)
-                    if news_data:
-                        # Send by producer
-                        key = str(news_data.get('channel_id', 'unknown'))
-                        await self.producer.send_news_async(news_data, key=key)
-
-                        logger.info(
-                            f"Parsed news from {news_data.get('channel_name')}: {news_data.get('text', '')[:10]}...")
-
-            except Exception as e:
-                logger.error(f"Error in message handler: {e}")
-
-    async def _should_process_message(self, message: Message) -> bool:
-        """Check if message should be processed"""
-
-        # Check if the message from right channel
-        if not hasattr(message.peer_id, 'channel_id') and not hasattr(message.peer_id, 'chat_id'):
-            return False
-
-        # if channels is empty, do not process message
-        if not self.monitored_channels:
-            return False
+        """Setting up handlers for messages from monitored channels"""
 
-        # Get current channel id
-        current_channel_id = getattr(message.peer_id, 'channel_id', getattr(message.peer_id, 'chat_id', None))
-        if not current_channel_id:
-            return False
-
-        # Find it among subscriptions
-        if current_channel_id not in self.monitored_channel_ids:
-            return False
-
-        return True
+        # if channels is empty, do not process messages
+        if not self.monitored_channels_by_id:
+            logger.warning("No channels for monitoring, messages will not be processed")
+            return
 
-    async def _parse_message(self, message: Message) -> Optional[Dict[str, Any]]:
+        async def message_handler(event):
+            """Process new messages, unexpected errors are logged by Telethon dispatcher"""
+            news = self._parse_message(event.message)
+            if news:
+                # Queue for sending by producer, waits if queue is full.
+                # Key is cached by add_channel, handler gets only messages of added channels
+                await self._queue.put((news, self._key_cache[news.channel_id]))
+
+                logger.info(f"Parsed news from {news.channel_name}: {news.text[:10]}...")
+
+        # Telethon filters chats on dispatch, so handler gets only monitored channels
+        self.client.add_event_handler(
+            message_handler,
+            events.NewMessage(chats=list(self.monitored_channels_by_id.values()))
+        )
+
+    async def _drain_loop(self):
+        """Send queued news to producer in batches until stop marker is received"""
+        loop = asyncio.get_running_loop()
+        queue_get = self._queue.get
+        queue_get_nowait = self._queue.get_nowait
+        send = self._send
+        stopping = False
+
+        while not stopping:
+            batch = []
+            item = await queue_get()
+            deadline = loop.time() + DRAIN_INTERVAL_SEC
+
+            # Collect batch by size or time limit
+            while True:
+                if item is None:
+                    stopping = True
+                    break
+
+                batch.append(item)
+                if len(batch) >= DRAIN_BATCH_SIZE:
+                    break
+
+                # Take already queued news without waiting
+                try:
+                    item = queue_get_nowait()
+                    continue
+                except asyncio.QueueEmpty:
+                    pass
+
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+
+                try:
+                    item = await asyncio.wait_for(queue_get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+
+            # Delivery is driven by producer polling, flush happens only on producer stop
+            for news, key in batch:
+                await send(news, key=key)
+
+    def _on_drain_done(self, task: asyncio.Task):
+        """Stop parser if drain loop failed, because parsed news can not be sent anymore"""
+        if task.cancelled() or task.exception() is None:
+            return
+
+        logger.error(f"Drain loop failed: {task.exception()}", exc_info=task.exception())
+        # Keep reference, so task is not garbage collected before disconnect
+        self._disconnect_task = asyncio.ensure_future(self.client.disconnect())
+
+    def _parse_message(self, message: Message) -> Optional[NewsRecord]:
         """Parse message and build kafka message"""
         try:
-            chat = await message.get_chat()
-
-            channel_id = getattr(message.peer_id, 'channel_id', getattr(message.peer_id, 'chat_id', None))
-            news_data = {
-                "id": f"{uuid.uuid4()}",
-                "source": "telegram",
-                "channel_id": channel_id,
-                "channel_name": chat.username if chat else None,
-                "channel_title": chat.title if chat else None,
-                "message_id": message.id,
-                "text": message.text or message.message or "",
-                "date": message.date.isoformat() if message.date else None,
-            }
-
-            return news_data
+            peer = message.peer_id
+            channel_id: Optional[int] = getattr(peer, 'channel_id', None) or getattr(peer, 'chat_id', None)
+
+            # Skip messages not from channel or chat, e.g. if configured identifier is a user
+            if not channel_id:
+                return None
+
+            chat = self.monitored_channels_by_id.get(channel_id)
+            if chat:
+                channel_name, channel_title = chat.username, chat.title
+            else:
+                channel_name = channel_title = None
+            message_id = message.id
+            date = message.date
+
+            # Raw text, message.text property would render markdown from entities.
+            # Links hidden behind text are appended, so they are not lost for url extraction
+            text = message.message or ""
+            entities = message.entities
+            if entities:
+                urls = [entity.url for entity in entities if isinstance(entity, MessageEntityTextUrl)]
+                if urls:
+                    text = "\n".join([text, *urls])
+
+            # (channel_id, message_id) is unique in Telegram
+            return NewsRecord(
+                id=f"tg:{channel_id}:{message_id}",
+                source="telegram",
+                channel_id=channel_id,
+                channel_name=channel_name,
+                channel_title=channel_title,
+                message_id=message_id,
+                text=text,
+                date=date.isoformat() if date else None,
+            )
 
         except Exception as e:
             logger.error(f"Error parsing message: {e}")
@@ -100,7 +168,8 @@ class TelegramNewsParser:
             entity = await self.client.get_entity(channel_identifier)
 
             # Add to cache
-            self.monitored_channel_ids.add(entity.id)
+            self.monitored_channels_by_id[entity.id] = entity
+            self._key_cache[entity.id] = str(entity.id).encode('utf-8')
 
             logger.info(f"Added channel to monitoring: {entity.username or entity.title}")
             return True
@@ -115,11 +184,16 @@ class TelegramNewsParser:
             await self.client.start()
             logger.info("Telegram parser started")
 
+            self._drain_task = asyncio.create_task(self._drain_loop())
+            self._drain_task.add_done_callback(self._on_drain_done)
+
             # Add channels from config
             for channel in self.monitored_channels:
                 if isinstance(channel, str):
                     await self.add_channel(channel)
 
+            self._setup_handlers()
+
             await self.client.run_until_disconnected()
 
         except KeyboardInterrupt:
@@ -129,4 +203,10 @@ class TelegramNewsParser:
             raise
         finally:
             await self.client.disconnect()
-            self.producer.close()
+
+            # Send news left in queue
+            if self._drain_task and not self._drain_task.done():
+                await self._queue.put(None)
+                await self._drain_task
+            elif not self._queue.empty():
+                logger.error(f"{self._queue.qsize()} parsed news were not sent, drain loop is not running")
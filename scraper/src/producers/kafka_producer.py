@@ -1,92 +1,127 @@
-import json
 import logging
 import asyncio
-from typing import Dict, Any, Optional
-from kafka import KafkaProducer
-from kafka.errors import KafkaError
-from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+import orjson
+from confluent_kafka import Producer, KafkaError, KafkaException, Message
+
+from src.models.news import NewsRecord
 
 logger = logging.getLogger(__name__)
 
+# Interval of polling producer for delivery reports
+POLL_INTERVAL_SEC = 0.05
+
+# Max time to wait for delivery of queued news on flush
+FLUSH_TIMEOUT_SEC = 30
+
 
 class KafkaNewsProducer:
     """Kafka Producer for sending hot tour news"""
 
-    def __init__(self, bootstrap_servers: str, topic: str = "news_raw"):
+    def __init__(
+            self,
+            bootstrap_servers: str,
+            topic: str = "news_raw",
+            max_inflight: int = 10_000,
+            linger_ms: int = 100,
+            acks: int | str = 1,
+    ):
         """
         Args:
             bootstrap_servers: kafka brokers addresses (separated by comma)
             topic: kafka topic name
+            max_inflight: max number of unacknowledged sends before waiting for deliveries
+            linger_ms: time to wait for more records before sending a batch
+            acks: number of acknowledgments required from brokers (0, 1 or 'all')
         """
         self.topic = topic
-        self.producer = self._init_producer(bootstrap_servers)
-        self.executor = ThreadPoolExecutor(max_workers=2)
+        self.max_inflight = max_inflight
+        self.producer = self._init_producer(bootstrap_servers, linger_ms, acks)
+        self._poll_task: asyncio.Task | None = None
         logger.info(f"Kafka producer initialized for topic '{topic}'")
 
-    def _init_producer(self, bootstrap_servers: str) -> KafkaProducer:
+    def _init_producer(self, bootstrap_servers: str, linger_ms: int, acks: int | str) -> Producer:
         """Initialize Kafka Producer"""
         try:
-            return KafkaProducer(
-                bootstrap_servers=bootstrap_servers.split(','),
-                value_serializer=lambda v: json.dumps(v, ensure_ascii=False).encode('utf-8'),
-                key_serializer=lambda k: str(k).encode('utf-8') if k else None,
-                acks='all',
-                retries=3,
-                linger_ms=10,
-                batch_size=16384,
-                max_block_ms=5000,
-                request_timeout_ms=30000
-            )
+            config = {
+                'bootstrap.servers': bootstrap_servers,
+                'acks': acks,
+                'linger.ms': linger_ms,
+                'compression.type': 'lz4',
+                'request.timeout.ms': 30000,
+            }
+
+            # Idempotence keeps order and removes retry duplicates with several requests in flight,
+            # librdkafka allows it only with acks=all
+            if acks == 'all':
+                config['enable.idempotence'] = True
+                config['max.in.flight.requests.per.connection'] = 5
+
+            return Producer(config)
         except Exception as e:
             logger.error(f"Failed to initialize Kafka producer: {e}")
             raise
 
-    def send_news(self, news_data: Dict[str, Any], key: Optional[str] = None) -> bool:
-        """Sync sending news to Kafka"""
-        try:
-            future = self.producer.send(
-                topic=self.topic,
-                key=key,
-                value=news_data
-            )
-
-            # Blocking wait for confirmation
-            record_metadata = future.get(timeout=10)
-
-            logger.debug(
-                f"News sent to Kafka - "
-                f"topic: {record_metadata.topic}, "
-                f"partition: {record_metadata.partition}, "
-                f"offset: {record_metadata.offset}"
-            )
-
-            return True
-
-        except KafkaError as e:
-            logger.error(f"Kafka send error: {e}")
-            return False
-        except Exception as e:
-            logger.error(f"Unexpected error sending to Kafka: {e}")
-            return False
+    async def start(self):
+        """Start polling producer for delivery reports"""
+        self._poll_task = asyncio.create_task(self._poll_loop())
+        logger.info("Kafka producer started")
+
+    async def _poll_loop(self):
+        """Serve delivery callbacks"""
+        while True:
+            self.producer.poll(0)
+            await asyncio.sleep(POLL_INTERVAL_SEC)
 
-    async def send_news_async(self, news_data: Dict[str, Any], key: Optional[str] = None) -> bool:
-        """Async sending news to Kafka"""
-        loop = asyncio.get_running_loop()
+    async def send_news_async(self, news: NewsRecord, key: Optional[bytes] = None) -> bool:
+        """Async sending news to Kafka without waiting for confirmation"""
         try:
-            return await loop.run_in_executor(
-                self.executor,
-                lambda: self.send_news(news_data, key)
-            )
-        except Exception as e:
-            logger.error(f"Error in async send: {e}")
+            # orjson serializes dataclasses natively
+            value = orjson.dumps(news)
+        except orjson.JSONEncodeError as e:
+            logger.error(f"Failed to serialize news: {e}")
             return False
 
-    def flush(self):
-        """Force sending news to Kafka"""
-        self.producer.flush()
+        # Backpressure: wait for deliveries when too many news are not acknowledged
+        while len(self.producer) >= self.max_inflight:
+            self.producer.poll(0)
+            await asyncio.sleep(POLL_INTERVAL_SEC)
+
+        while True:
+            try:
+                self.producer.produce(self.topic, value=value, key=key, on_delivery=self._on_delivery)
+                return True
+            except BufferError:
+                # Local producer queue is full, wait for deliveries
+                self.producer.poll(0)
+                await asyncio.sleep(POLL_INTERVAL_SEC)
+            except KafkaException as e:
+                logger.error(f"Kafka send error: {e}")
+                return False
+
+    @staticmethod
+    def _on_delivery(error: KafkaError | None, message: Message):
+        """Log result of delivery"""
+        if error is not None:
+            logger.error(f"Kafka send error: {error}")
+            return
+
+        logger.debug(
+            f"News sent to Kafka - "
+            f"topic: {message.topic()}, "
+            f"partition: {message.partition()}, "
+            f"offset: {message.offset()}"
+        )
+
+    async def flush(self):
+        """Force sending news to Kafka and wait for all confirmations"""
+        remaining = await asyncio.to_thread(self.producer.flush, FLUSH_TIMEOUT_SEC)
+        if remaining:
+            logger.warning(f"{remaining} news were not delivered to Kafka after flush")
 
-    def close(self):
+    async def stop(self):
         """Close resources"""
-        self.producer.close(timeout=5)
-        self.executor.shutdown(wait=True)
+        await self.flush()
+        if self._poll_task:
+            self._poll_task.cancel()
         logger.info("Kafka producer closed")